@@ -7,13 +7,22 @@ Website Media Optimizer (Final Version)
 - Maintains perceptual quality; backups originals; prints summary table
 """
 
-import os, sys, shutil, subprocess, io
+import os, sys, re, mmap, math, shutil, collections, subprocess, io, argparse, functools, ctypes, ctypes.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from PIL import Image, ImageFile
 from tqdm import tqdm
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
+try:    # optional: batched statx through io_uring (Linux)
+    import liburing
+except (ImportError, OSError):
+    liburing = None
+try:    # optional: Aho-Corasick automaton for reference rewriting
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 console = Console()
@@ -23,6 +32,7 @@ console = Console()
 # -----------------------
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".gif"}
 VIDEO_EXTS = {".mp4", ".mov", ".webm"}
+MEDIA_EXTS = IMAGE_EXTS|VIDEO_EXTS
 TEXT_EXTS  = {".html", ".js", ".css"}
 BACKUP_DIR = "backup_originals"
 EXCLUDE_DIRS = {BACKUP_DIR, ".git", "node_modules", "dist", "build", ".next"}
@@ -30,58 +40,278 @@ EXCLUDE_DIRS = {BACKUP_DIR, ".git", "node_modules", "dist", "build", ".next"}
 HEAVY = {".jpg":800_000,".jpeg":800_000,".png":800_000,".webp":400_000,".avif":400_000,
          ".gif":2_000_000,".mp4":8_000_000,".mov":8_000_000,".webm":8_000_000}
 IDEAL = {"images":250_000,"videos":5_000_000}
+MAX_DIM = {1:None,2:None,3:3840,4:2560,5:1920}   # longest image side per intensity (None = keep)
+PROBE_SECS = 10        # sample encoded to estimate the CRF that lands on IDEAL["videos"]
+PROBE_CRF = 23
+PROBE_SLOW_RATIO = 0.75   # rough size of -preset slow/medium output vs the ultrafast probe, same CRF
+AUDIO_BPS = 128_000
+PRESET = {1:"medium",2:"medium",3:"slow",4:"slow",5:"veryslow"}   # x264 effort per intensity
+CPUS = os.cpu_count() or 1
+DEFAULT_JOBS = max(1,CPUS//4)   # concurrent ffmpeg jobs; -preset slow keeps ~4 threads busy
+IMAGE_WORKERS = min(CPUS,61)    # image pool; ProcessPoolExecutor rejects >61 workers on Windows
+MAX_TEXT_SIZE = 10_000_000      # larger .html/.js/.css are vendored/minified blobs → not rewritten
+TEXT_WORKERS = 16               # threads overlapping text-file reads in replace_refs
+VAAPI_DEVICE = "/dev/dri/renderD128"
+HW_JOBS = 2                     # concurrent GPU encodes; consumer NVENC caps open sessions
+OXIPNG = shutil.which("oxipng")   # optional: lossless, multithreaded PNG optimizer
+X264_ASM = "mmx2,sse2,ssse3,sse4,avx"   # no AVX2/BMI2: faster on AMD family 17h (Zen1/Zen2)
+TJPF_RGB, TJSAMP_444, TJFLAG_ACCURATEDCT, TJFLAG_PROGRESSIVE = 0, 0, 4096, 16384   # turbojpeg.h
+URING_DEPTH = 128               # statx requests submitted per io_uring_enter
 
 # -----------------------
 # HELPERS
 # -----------------------
+SIZE_UNITS = ("","K","M","G","T")
+
 def sizeof_fmt(num, suffix="B"):
-    for unit in ["","K","M","G"]:
-        if abs(num) < 1024:
-            return f"{num:3.1f}{unit}{suffix}"
-        num /= 1024
-    return f"{num:.1f}T{suffix}"
+    i = min(4, max(0, (abs(int(num)).bit_length()-1)//10))   # 1024**i <= |num| < 1024**(i+1)
+    return f"{num/(1<<10*i):3.1f}{SIZE_UNITS[i]}{suffix}"
 
+@functools.lru_cache(maxsize=1)
 def ensure_ffmpeg():
+    """True if ffmpeg runs; probed once per process."""
     try:
         subprocess.run(["ffmpeg","-version"],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL,check=True)
         return True
     except Exception:
         return False
 
+_turbo = None
+def get_turbo():
+    """(lib, tjhandle) for libturbojpeg, opened once per process; None if the library is missing.
+    The handle is reused for every image — fine, since each pool worker encodes on one thread."""
+    global _turbo
+    if _turbo is None:
+        _turbo=False
+        name=ctypes.util.find_library("turbojpeg")
+        try:   # missing symbols (e.g. tjGetErrorStr2 before libjpeg-turbo 2.0) → unavailable, use Pillow
+            if name:
+                lib=ctypes.CDLL(name)
+                lib.tjInitCompress.restype=ctypes.c_void_p
+                lib.tjCompress2.argtypes=[ctypes.c_void_p,ctypes.c_char_p,ctypes.c_int,ctypes.c_int,ctypes.c_int,
+                                          ctypes.c_int,ctypes.POINTER(ctypes.c_void_p),ctypes.POINTER(ctypes.c_ulong),
+                                          ctypes.c_int,ctypes.c_int,ctypes.c_int]
+                lib.tjFree.argtypes=[ctypes.c_void_p]
+                lib.tjGetErrorStr2.argtypes=[ctypes.c_void_p]
+                lib.tjGetErrorStr2.restype=ctypes.c_char_p
+                handle=lib.tjInitCompress()
+                if handle: _turbo=(lib,handle)
+        except (AttributeError, OSError):
+            pass
+    return _turbo or None
+
+def turbo_jpeg(turbo, im, q):
+    """tjCompress2 straight from Pillow's RGB buffer: 4:4:4, accurate DCT, progressive
+    (tjCompress2 only optimizes Huffman tables for progressive; baseline would be ~5% larger)."""
+    lib,handle=turbo
+    out,size=ctypes.c_void_p(),ctypes.c_ulong()
+    if lib.tjCompress2(handle,im.tobytes(),im.width,0,im.height,TJPF_RGB,ctypes.byref(out),ctypes.byref(size),
+                       TJSAMP_444,q,TJFLAG_ACCURATEDCT|TJFLAG_PROGRESSIVE):
+        raise OSError(lib.tjGetErrorStr2(handle).decode(errors="replace"))
+    try: return ctypes.string_at(out,size.value)
+    finally: lib.tjFree(out)
+
+def jpeg_app_segments(exif=None, icc_profile=None):
+    """APP1 (Exif) and APP2 (ICC, split into numbered chunks) segments as Pillow writes them."""
+    segs=[]
+    if exif: segs.append(b"\xff\xe1"+(len(exif)+2).to_bytes(2,"big")+exif)
+    if icc_profile:
+        parts=[icc_profile[i:i+65519] for i in range(0,len(icc_profile),65519)]
+        for n,part in enumerate(parts,1):
+            body=b"ICC_PROFILE\0"+bytes((n,len(parts)))+part
+            segs.append(b"\xff\xe2"+(len(body)+2).to_bytes(2,"big")+body)
+    return b"".join(segs)
+
+def fast_jpeg(im, q, exif=None, icc_profile=None):
+    """Encode an RGB image through libturbojpeg; None if it is not installed (→ Pillow).
+    tjCompress2 writes no metadata, so EXIF/ICC are spliced in right after SOI."""
+    turbo=get_turbo()
+    if not turbo: return None
+    data=turbo_jpeg(turbo,im,q)
+    meta=jpeg_app_segments(exif,icc_profile)
+    return data[:2]+meta+data[2:] if meta else data
+
+def hw_args(enc, crf):
+    """ffmpeg video args for a GPU H.264 encoder at roughly libx264-equivalent `crf`."""
+    if enc=="h264_nvenc": return ["-c:v","h264_nvenc","-preset","p5","-rc","vbr","-cq",str(crf),"-b:v","0"]
+    return ["-vaapi_device",VAAPI_DEVICE,"-vf","format=nv12,hwupload","-c:v","h264_vaapi","-qp",str(crf)]
+
+@functools.lru_cache(maxsize=1)
+def hw_encoder():
+    """First GPU H.264 encoder that can open a session (probed once), or None."""
+    try:
+        out=subprocess.run(["ffmpeg","-hide_banner","-encoders"],capture_output=True,text=True,check=True).stdout
+    except Exception:
+        return None
+    for enc in ("h264_nvenc","h264_vaapi"):
+        if enc not in out: continue
+        probe=["ffmpeg","-hide_banner","-f","lavfi","-i","color=s=256x256:d=0.1"]+hw_args(enc,23)+["-f","null","-"]
+        if subprocess.run(probe,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL).returncode==0: return enc
+    return None
+
+@functools.lru_cache(maxsize=1)
+def is_zen12():
+    """True on AMD CPU family 17h (Zen, Zen+, Zen2), read once from /proc/cpuinfo."""
+    try:
+        with open("/proc/cpuinfo") as h: info=h.read().split("\n\n",1)[0]
+    except OSError:
+        return False
+    fields=dict(l.split(":",1) for l in info.splitlines() if ":" in l)
+    fields={k.strip():v.strip() for k,v in fields.items()}
+    return fields.get("vendor_id")=="AuthenticAMD" and fields.get("cpu family")=="23"
+
+def video_codec(crf, hwaccel=True, preset="slow", sw=None, tune_asm=False):
+    """GPU encoder args when available, else libx264 (`sw` overrides the software args)."""
+    enc=hw_encoder() if hwaccel else None
+    if enc: return hw_args(enc,crf)
+    args=sw or ["-vcodec","libx264","-crf",str(crf),"-preset",preset]
+    if tune_asm and is_zen12(): args=args+["-x264-params",f"asm={X264_ASM}"]
+    return args
+
+def oxipng(data):
+    """Losslessly recompress PNG bytes through oxipng (stdin → stdout).
+    Single-threaded: it already runs inside one image worker per core."""
+    return subprocess.run([OXIPNG,"-o","4","--strip","safe","--alpha","-t","1","--stdout","-"],
+                          input=bytes(data),capture_output=True,check=True).stdout
+
+def ffmpeg_threads(jobs:int)->int:
+    """Split the cores between `jobs` concurrent ffmpeg processes."""
+    return max(2,CPUS//max(1,jobs))
+
+def clone_file(src, dst):
+    """Copy via copy_file_range: a reflink on btrfs/XFS, server-side on NFS, in-kernel otherwise.
+    False if the kernel/filesystem can't do it, so the caller falls back."""
+    if not hasattr(os,"copy_file_range"): return False
+    try:
+        with open(src,"rb") as i, open(dst,"wb") as o:
+            left=os.fstat(i.fileno()).st_size
+            while left>0:
+                n=os.copy_file_range(i.fileno(),o.fileno(),left)
+                if n==0: return False
+                left-=n
+    except OSError:
+        return False
+    shutil.copystat(src,dst)
+    return True
+
 def backup(path, base):
     rel = os.path.relpath(path, base)
     bpath = os.path.join(base,BACKUP_DIR,rel)
     os.makedirs(os.path.dirname(bpath),exist_ok=True)
-    shutil.copy2(path,bpath)
+    if not clone_file(path,bpath): shutil.copy2(path,bpath)
+
+# IJG (libjpeg) standard luminance table; quality q scales it by 5000/q (q<50) or 200-2q
+STD_LUMA_SUM = sum((16,11,10,16,24,40,51,61, 12,12,14,19,26,58,60,55, 14,13,16,24,40,57,69,56,
+                    14,17,22,29,51,87,80,62, 18,22,37,56,68,109,103,77, 24,35,55,64,81,104,113,92,
+                    49,64,78,87,103,121,120,101, 72,92,95,98,112,100,103,99))
+
+def jpeg_quality(im):
+    """Estimate the IJG quality a JPEG was saved at from its luminance table; None if not a JPEG."""
+    tables=getattr(im,"quantization",None)
+    if not tables or 0 not in tables: return None
+    scale=sum(tables[0])*100/STD_LUMA_SUM
+    return round((200-scale)/2 if scale<=100 else 5000/scale)
+
+Q_BASE   = (95,90,85,80,75)   # indexed by intensity-1
+CRF_BASE = (18,20,22,24,26)
 
 def adaptive_quality(intensity:int, img_size:int, target:int)->int:
     """Map intensity 1–5 to target-based JPEG/WebP quality (75–95)."""
-    base_q = {1:95,2:90,3:85,4:80,5:75}[intensity]
     # small nudge if still far from target
-    if img_size > target*3 and intensity>=3: base_q -= 5
-    return max(70, min(95, base_q))
+    q = Q_BASE[intensity-1] - (5 if img_size > target*3 and intensity>=3 else 0)
+    return 95 if q>95 else 70 if q<70 else q
 
-def adaptive_crf(intensity:int, vid_size:int, target:int)->int:
-    """Map intensity 1–5 to CRF (18–28) aiming for Ideal Target."""
-    base_crf = {1:18,2:20,3:22,4:24,5:26}[intensity]
-    if vid_size > target*3 and intensity>=3: base_crf += 2
-    return min(30,max(16,base_crf))
+def adaptive_crf(intensity:int, vid_size:int, target:int, est:int=None)->int:
+    """Map intensity 1–5 to CRF (18–28) aiming for Ideal Target.
+    `est` (from target_crf) replaces the fixed nudge; it only ever raises the CRF, at intensity ≥3."""
+    if est is not None and intensity>=3: crf = max(CRF_BASE[intensity-1], est)
+    else: crf = CRF_BASE[intensity-1] + (2 if vid_size > target*3 and intensity>=3 else 0)
+    return 30 if crf>30 else 16 if crf<16 else crf
+
+def target_crf(path, target, jobs=1):
+    """Fast first pass: encode PROBE_SECS from the middle at ultrafast/PROBE_CRF, project the full
+    size from the ffprobe duration and pick the CRF that fits `target` (+6 CRF ≈ half the bits).
+    None if probing fails. Runs before the encodes are scheduled, `jobs` probes at a time."""
+    probe=path+".probe.mp4"
+    try:
+        dur=float(subprocess.run(["ffprobe","-v","error","-show_entries","format=duration","-of","csv=p=0",path],
+                                 capture_output=True,text=True,check=True).stdout.strip())
+        secs=min(PROBE_SECS,dur)
+        subprocess.run(["ffmpeg","-y","-ss",str(max(0,dur/2-secs/2)),"-t",str(secs),"-i",path,
+                        "-an","-threads",str(ffmpeg_threads(jobs)),"-vcodec","libx264","-preset","ultrafast","-crf",str(PROBE_CRF),probe],
+                       stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL,check=True)
+        projected=os.path.getsize(probe)/secs*dur*PROBE_SLOW_RATIO
+        budget=target-AUDIO_BPS/8*dur
+        if budget<=0: return 30
+        return PROBE_CRF+math.ceil(6*math.log2(projected/budget))
+    except Exception:
+        return None
+    finally:
+        if os.path.exists(probe): os.remove(probe)
 
 # -----------------------
 # FILE COLLECTION / ANALYSIS
 # -----------------------
+def open_ring():
+    """io_uring ring for batched statx, or None (no liburing, old kernel, io_uring disabled)."""
+    if liburing is None: return None
+    for flags in (liburing.IORING_SETUP_SINGLE_ISSUER,0):   # collect() runs on one thread
+        ring=liburing.Ring()
+        try:
+            liburing.io_uring_queue_init(URING_DEPTH,ring,flags)
+            return ring
+        except OSError: continue
+    return None
+
+def uring_stat(ring, found):
+    """statx every (path, ext) in found, URING_DEPTH per submission; drops files that fail.
+    Rows keep scandir order (by submission index), not completion order."""
+    out=[]
+    for i in range(0,len(found),URING_DEPTH):
+        chunk=found[i:i+URING_DEPTH]
+        stats=[liburing.Statx() for _ in chunk]
+        rows=[None]*len(chunk)
+        for j,((p,_),st) in enumerate(zip(chunk,stats)):
+            sqe=liburing.io_uring_get_sqe(ring)
+            liburing.io_uring_prep_statx(sqe,st,p,0,liburing.STATX_SIZE)
+            liburing.io_uring_sqe_set_data64(sqe,j)
+        liburing.io_uring_submit_and_wait(ring,len(chunk))
+        cqe=liburing.Cqe()
+        for _ in chunk:
+            liburing.io_uring_wait_cqe(ring,cqe)
+            c=cqe[0]; j=c.user_data
+            try: c.res; ok=True   # .res raises OSError for a failed statx
+            except OSError: ok=False
+            liburing.io_uring_cqe_seen(ring,c)
+            if ok: rows[j]=(*chunk[j],stats[j].size)
+        out.extend(r for r in rows if r is not None)
+    return out
+
+def scan(base, ring=None):
+    """Yield (path, ext, size) for media under base; one stat per file via DirEntry,
+    or batched statx per directory when an io_uring ring is given."""
+    try: it=os.scandir(base)
+    except OSError: return
+    subdirs,found=[],[]
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in EXCLUDE_DIRS: subdirs.append(entry.path)
+                    continue
+                ext=os.path.splitext(entry.name)[1].lower()
+                if ext not in MEDIA_EXTS: continue
+                if ring is None: yield entry.path,ext,entry.stat().st_size
+                else: found.append((entry.path,ext))
+            except OSError: continue
+    if found: yield from uring_stat(ring,found)
+    for d in subdirs: yield from scan(d,ring)
+
 def collect(base):
-    files=[]
-    for r,ds,fs in os.walk(base):
-        ds[:] = [d for d in ds if d not in EXCLUDE_DIRS]
-        for f in fs:
-            ext=os.path.splitext(f.lower())[1]
-            if ext in IMAGE_EXTS|VIDEO_EXTS:
-                p=os.path.join(r,f)
-                try:size=os.path.getsize(p)
-                except:continue
-                files.append((p,ext,size))
-    return files
+    ring=open_ring()
+    if ring is None: return list(scan(base))
+    try: return list(scan(base,ring))
+    finally: liburing.io_uring_queue_exit(ring)
 
 def analyze(files):
     img,vid,gif=0,0,0
@@ -101,76 +331,219 @@ def analyze(files):
 # -----------------------
 def optimize_image(path, base, intensity):
     orig=os.path.getsize(path)
-    backup(path,base)
     ext=os.path.splitext(path)[1].lower()
     q=adaptive_quality(intensity,orig,IDEAL["images"])
+    cap=MAX_DIM[intensity]
+    try:
+        with Image.open(path) as im:   # header only, no decode
+            if getattr(im,"is_animated",False) and im.format!="MPO":   # MPO (gain-map/stereo JPEG): primary frame
+                return orig,orig,"animated"   # one frame would be saved
+            resize=bool(cap) and max(im.size)>cap
+            existing=jpeg_quality(im) if ext in (".jpg",".jpeg") else None
+        if not resize and existing is not None and existing<=q+2: return orig,orig,"already-optimized"
+    except Exception as e:
+        return orig,orig,f"error:{e}"
+    backup(path,base)
     try:
         with Image.open(path) as im:
-            im=im.convert("RGB")
-            tmp=path+".tmp"
-            im.save(tmp,quality=q,optimize=True,subsampling=0)
-            new=os.path.getsize(tmp)
-            if new<orig: os.replace(tmp,path)
-            else: os.remove(tmp); new=orig
-        return orig,new,f"q={q}"
+            if ext==".png" and OXIPNG and not resize:
+                with open(path,"rb") as h: data=h.read()   # lossless pass below needs no decode
+            else:
+                if resize:
+                    fit=max(im.size)/cap
+                    im.draft("RGB",(int(im.width/fit),int(im.height/fit)))   # JPEG: 1/2–1/8 scale inside the IDCT
+                meta={k:im.info[k] for k in ("exif","icc_profile") if im.info.get(k)}   # Orientation, colour space
+                if meta.get("icc_profile",b"")[16:20]!=b"RGB ": meta.pop("icc_profile",None)   # GRAY/CMYK profile ≠ RGB output
+                # JPEG has no alpha; PNG/WebP/AVIF keep their transparency
+                alpha=ext not in (".jpg",".jpeg") and (im.mode in ("RGBA","LA","PA") or "transparency" in im.info)
+                mode="RGBA" if alpha else "RGB"
+                if im.mode!=mode: im=im.convert(mode)
+                if resize: im.thumbnail((cap,cap),Image.LANCZOS)
+                dims=im.size
+                data=fast_jpeg(im,q,**meta) if ext in (".jpg",".jpeg") else None
+                if data is None:
+                    buf=io.BytesIO()
+                    fmt=Image.registered_extensions().get(ext)
+                    chroma={"JPEG":{"subsampling":0},"AVIF":{"subsampling":"4:4:4"}}.get(fmt,{})   # no 4:2:0 colour bleed
+                    im.save(buf,format=fmt,quality=q,optimize=True,**chroma,**meta)
+                    data=buf.getbuffer()
+        if ext==".png" and OXIPNG: data=oxipng(data)
+        # encoded in memory: touch the disk only when it is a win or MAX_DIM applies (original is in backup_originals/)
+        new=len(data)
+        if new<orig or resize:
+            with open(path,"wb") as h: h.write(data)
+        else: new=orig
+        note="oxipng" if ext==".png" and OXIPNG else f"q={q}"
+        return orig,new,f"{note} {dims[0]}×{dims[1]}" if resize else note
     except Exception as e:
         return orig,orig,f"error:{e}"
 
-def optimize_video(path, base, intensity):
-    if not ensure_ffmpeg():
-        return os.path.getsize(path),os.path.getsize(path),"ffmpeg missing"
+def _image_init():
+    ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+def _image_worker(task):
+    """Pool entry point: optimize one image, return a summary row.
+    Only (path, action, sizes, note) crosses the process boundary — pixels and encoded
+    bytes stay in the child, which writes the file itself, so nothing large is pickled."""
+    p,base,intensity=task
+    o,n,note=optimize_image(p,base,intensity)
+    return (p,"compress" if n<o else "resize" if n>o else "skip",o,n,note)
+
+def launch(cmd):
+    """Start ffmpeg in its own session: a Ctrl-C reaches only us, and run_jobs kills the job.
+    The output file must be the last argument; run_jobs deletes it if the job is killed."""
+    return subprocess.Popen(cmd,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL,start_new_session=True)
+
+def failed(result):
+    return None,lambda rc: result
+
+def start_video(path, base, intensity, jobs=1, hwaccel=True, tune_asm=False, est=None):
+    """Launch ffmpeg for one video → (proc, finish); finish(returncode) gives (orig, new, note).
+    `est` is the probed CRF from target_crf (probed up front, so launching never blocks)."""
     orig=os.path.getsize(path)
+    if not ensure_ffmpeg(): return failed((orig,orig,"ffmpeg missing"))
     backup(path,base)
-    crf=adaptive_crf(intensity,orig,IDEAL["videos"])
+    crf=adaptive_crf(intensity,orig,IDEAL["videos"],est)
     tmp=path+".tmp.mp4"
-    cmd=["ffmpeg","-y","-i",path,"-vcodec","libx264","-crf",str(crf),
-         "-preset","slow","-acodec","aac","-b:a","128k","-movflags","+faststart",tmp]
-    try:
-        subprocess.run(cmd,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL,check=True)
-        new=os.path.getsize(tmp)
-        if new<orig: os.replace(tmp,path)
-        else: os.remove(tmp); new=orig
-        return orig,new,f"crf={crf}"
-    except Exception as e:
-        return orig,orig,f"error:{e}"
+    def attempt(hw):
+        cmd=["ffmpeg","-y","-i",path]+video_codec(crf,hw,PRESET[intensity],tune_asm=tune_asm)+["-threads",str(ffmpeg_threads(jobs)),
+             "-acodec","aac","-b:a",str(AUDIO_BPS),"-movflags","+faststart",tmp]
+        def finish(rc):
+            if rc and hw and hw_encoder(): return lambda: attempt(False)   # GPU refused it → libx264
+            try:
+                if rc: raise subprocess.CalledProcessError(rc,"ffmpeg")
+                new=os.path.getsize(tmp)
+                if new<orig: os.replace(tmp,path)
+                else: os.remove(tmp); new=orig
+                return orig,new,f"crf={crf}"
+            except Exception as e:
+                return orig,orig,f"error:{e}"
+        try: return launch(cmd),finish
+        except Exception as e: return failed((orig,orig,f"error:{e}"))
+    return attempt(hwaccel)
 
-def convert_gif(path, base, target_ext):
-    if not ensure_ffmpeg():
-        return os.path.getsize(path),os.path.getsize(path),"ffmpeg missing",path
+def start_gif(path, base, target_ext, jobs=1, hwaccel=True, tune_asm=False):
+    """Launch ffmpeg for one GIF → (proc, finish); finish(returncode) gives (orig, new, note, new_path)."""
     orig=os.path.getsize(path)
+    if not ensure_ffmpeg(): return failed((orig,orig,"ffmpeg missing",path))
     backup(path,base)
     newp=os.path.splitext(path)[0]+target_ext
-    codec=["libx264"] if target_ext==".mp4" else ["libvpx-vp9","-b:v","0","-crf","32"]
-    cmd=["ffmpeg","-y","-i",path,"-movflags","+faststart","-an","-vcodec"]+codec+[newp]
+    def attempt(hw):
+        if target_ext==".mp4": codec=video_codec(23,hw,sw=["-vcodec","libx264"],tune_asm=tune_asm)
+        else: codec=["-vcodec","libvpx-vp9","-b:v","0","-crf","32"]
+        cmd=["ffmpeg","-y","-i",path,"-threads",str(ffmpeg_threads(jobs)),
+             "-movflags","+faststart","-an"]+codec+[newp]
+        def finish(rc):
+            if rc and hw and target_ext==".mp4" and hw_encoder(): return lambda: attempt(False)   # GPU refused it → libx264
+            try:
+                if rc: raise subprocess.CalledProcessError(rc,"ffmpeg")
+                return orig,os.path.getsize(newp),f"gif→{target_ext[1:]}",newp
+            except Exception as e:
+                return orig,orig,f"error:{e}",path
+        try: return launch(cmd),finish
+        except Exception as e: return failed((orig,orig,f"error:{e}",path))
+    return attempt(hwaccel)
+
+def reap(running):
+    """Block until one of the running jobs exits → (pid, exit code)."""
+    if hasattr(os,"wait"):
+        while True:
+            pid,status=os.wait()
+            if pid in running: return pid,os.waitstatus_to_exitcode(status)
+    while True:   # no os.wait (Windows): round-robin with short timeouts
+        for pid,(_,proc,_) in running.items():
+            try: return pid,proc.wait(timeout=0.1)
+            except subprocess.TimeoutExpired: pass
+
+def run_jobs(starts, jobs, desc):
+    """Keep `jobs` ffmpeg processes in flight. `starts` maps key → start() returning (proc, finish);
+    returns key → finish(returncode). A finish() that returns a start() (GPU → libx264 fallback)
+    is relaunched ahead of new work. Unfinished jobs are killed on Ctrl-C or error and their
+    partial output removed, so the next run doesn't pick it up as media."""
+    todo=collections.deque(starts.items())
+    running,results={},{}
     try:
-        subprocess.run(cmd,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL,check=True)
-        new=os.path.getsize(newp)
-        return orig,new,f"gif→{target_ext[1:]}",newp
-    except Exception as e:
-        return orig,orig,f"error:{e}",path
+        with tqdm(total=len(starts),desc=desc) as bar:
+            while True:
+                while len(running)<jobs and todo:
+                    key,start=todo.popleft()
+                    proc,finish=start()
+                    if proc is None: results[key]=finish(None); bar.update(); continue
+                    running[proc.pid]=(key,proc,finish)
+                if not running: return results
+                pid,rc=reap(running)
+                key,proc,finish=running.pop(pid)
+                proc.returncode=rc
+                res=finish(rc)
+                if callable(res): todo.appendleft((key,res)); continue
+                results[key]=res; bar.update()
+    finally:
+        for _,proc,_ in running.values():
+            proc.kill(); proc.wait()
+            try: os.remove(proc.args[-1])
+            except OSError: pass
+
+def build_replacer(by_name):
+    """Return f(text) that rewrites every key of by_name in a single pass (longest match wins)."""
+    if ahocorasick is not None:
+        A=ahocorasick.Automaton()
+        for old,nw in by_name.items(): A.add_word(old,(len(old),nw))
+        A.make_automaton()
+        def replace(data):
+            out,pos=[],0
+            for end,(n,nw) in A.iter_long(data):
+                out.append(data[pos:end-n+1]); out.append(nw); pos=end+1
+            if not out: return data
+            out.append(data[pos:])
+            return "".join(out)
+        return replace
+    pat=re.compile("|".join(map(re.escape,sorted(by_name,key=len,reverse=True))))
+    return lambda data: pat.sub(lambda m: by_name[m.group(0)],data)
+
+def rewrite_refs(fp, needles, replace):
+    """Rewrite one text file; True if it changed. Files without any needle are never decoded."""
+    size=os.path.getsize(fp)
+    if not 0<size<=MAX_TEXT_SIZE: return False
+    with open(fp,"rb") as h, mmap.mmap(h.fileno(),0,access=mmap.ACCESS_READ) as mm:
+        if not any(mm.find(n)!=-1 for n in needles): return False
+        data=mm[:].decode("utf-8",errors="ignore")
+    newd=replace(data)
+    if newd==data: return False
+    with open(fp,"w",encoding="utf-8",newline="") as o:o.write(newd)   # keep CRLF as-is on Windows too
+    return True
 
 def replace_refs(base,mapping):
-    modified=[]
     by_name={os.path.basename(k):os.path.basename(v) for k,v in mapping.items()}
-    for r,_,fs in os.walk(base):
-        for f in fs:
-            if os.path.splitext(f)[1].lower() not in TEXT_EXTS: continue
-            fp=os.path.join(r,f)
-            try:
-                with open(fp,"r",encoding="utf-8",errors="ignore") as h: data=h.read()
-                newd=data
-                for old,nw in by_name.items():
-                    newd=newd.replace(old,nw)
-                if newd!=data:
-                    with open(fp,"w",encoding="utf-8") as o:o.write(newd)
-                    modified.append(fp)
-            except: continue
-    return modified
+    needles=[k.encode("utf-8") for k in by_name]
+    replace=build_replacer(by_name)
+    paths=[os.path.join(r,f) for r,_,fs in os.walk(base) for f in fs
+           if os.path.splitext(f)[1].lower() in TEXT_EXTS]
+    def one(fp):
+        try: return rewrite_refs(fp,needles,replace)
+        except: return False
+    with ThreadPoolExecutor(max_workers=TEXT_WORKERS) as ex:
+        return [fp for fp,hit in zip(paths,ex.map(one,paths)) if hit]
 
 # -----------------------
 # MAIN FLOW
 # -----------------------
+def parse_args(argv=None):
+    ap=argparse.ArgumentParser(description="Analyze and optimize website media in the current directory.")
+    ap.add_argument("-j","--jobs",type=int,default=DEFAULT_JOBS,
+                    help=f"concurrent ffmpeg jobs for videos/GIFs (default: {DEFAULT_JOBS})")
+    ap.add_argument("--no-hwaccel",dest="hwaccel",action="store_false",
+                    help="always encode H.264 on the CPU (libx264), even if NVENC/VAAPI works")
+    ap.add_argument("--hw-jobs",type=int,default=HW_JOBS,
+                    help=f"cap on concurrent GPU encodes when NVENC/VAAPI is used (default: {HW_JOBS})")
+    ap.add_argument("--tune-asm",action="store_true",
+                    help="on AMD Zen1/Zen2, restrict libx264 to AVX-and-below SIMD (a few %% faster)")
+    args=ap.parse_args(argv)
+    if args.jobs<1: ap.error("--jobs must be >= 1")
+    if args.hw_jobs<1: ap.error("--hw-jobs must be >= 1")
+    return args
+
 def main():
+    args=parse_args()
     base=os.getcwd()
     console.rule("[bold yellow]Website Media Optimizer[/bold yellow]")
     files=collect(base)
@@ -214,18 +587,29 @@ def main():
     console.rule("[bold green]Optimizing…[/bold green]")
     summary=[]
     mapping={}
+    enc=None
+    if args.hwaccel and (hv or target_ext==".mp4"):   # probe once before the pools start
+        enc=hw_encoder()
+        if enc: console.print(f"[cyan]H.264 on GPU via {enc}[/cyan]")
+    hw_jobs=min(args.jobs,args.hw_jobs) if enc else args.jobs   # GPU session limit
 
-    # Optimize images
-    for p,e,s in tqdm([x for x in files if x[1] in IMAGE_EXTS and x[1]!=".gif"],desc="Images"):
+    # Optimize images (CPU-bound encode → one worker per core)
+    tasks=[]
+    for p,e,s in [x for x in files if x[1] in IMAGE_EXTS and x[1]!=".gif"]:
         if s<HEAVY.get(e,9e9): summary.append((p,"skip",s,s,"below heavy")); continue
-        o,n,note=optimize_image(p,base,lvl)
-        act="compress" if n<o else "skip"
-        summary.append((p,act,o,n,note))
+        tasks.append((p,base,lvl))
+    if tasks:
+        with ProcessPoolExecutor(max_workers=IMAGE_WORKERS,initializer=_image_init) as ex:
+            for row in tqdm(ex.map(_image_worker,tasks,chunksize=4),total=len(tasks),desc="Images"):
+                summary.append(row)
 
-    # GIFs
+    # GIFs (ffmpeg subprocesses, args.jobs in flight)
     if target_ext:
-        for p in tqdm(hg,desc="GIFs"):
-            o,n,note,newp=convert_gif(p,base,target_ext)
+        gjobs=hw_jobs if target_ext==".mp4" else args.jobs
+        res=run_jobs({p:functools.partial(start_gif,p,base,target_ext,gjobs,args.hwaccel,args.tune_asm)
+                      for p in hg},gjobs,"GIFs")
+        for p in hg:
+            o,n,note,newp=res[p]
             mapping[p]=newp
             act="convert" if n<o or newp!=p else "skip"
             summary.append((p,act,o,n,note))
@@ -233,11 +617,21 @@ def main():
         for p in hg: summary.append((p,"skip",os.path.getsize(p),os.path.getsize(p),"skipped"))
 
     # Videos
-    for p,e,s in tqdm([x for x in files if x[1] in VIDEO_EXTS],desc="Videos"):
+    vids=[]
+    for p,e,s in [x for x in files if x[1] in VIDEO_EXTS]:
         if s<HEAVY.get(e,9e9): summary.append((p,"skip",s,s,"below heavy")); continue
-        o,n,note=optimize_video(p,base,lvl)
+        vids.append(p)
+    est={}
+    if vids and lvl>=3 and ensure_ffmpeg():   # CRF probes up front, so encode slots never wait on them
+        with ThreadPoolExecutor(max_workers=args.jobs) as ex:
+            res=ex.map(lambda p: target_crf(p,IDEAL["videos"],args.jobs),vids)
+            est=dict(zip(vids,tqdm(res,total=len(vids),desc="Probing")))
+    res=run_jobs({p:functools.partial(start_video,p,base,lvl,hw_jobs,args.hwaccel,args.tune_asm,est.get(p))
+                  for p in vids},hw_jobs,"Videos")
+    for p in vids:
+        o,n,note=res[p]
         act="compress" if n<o else "skip"
-        summary.append((p,act,o,n,n,note))
+        summary.append((p,act,o,n,note))
 
     mod=[]
     if ref_ok and mapping: mod=replace_refs(base,mapping)